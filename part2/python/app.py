@@ -8,8 +8,11 @@ from gevent import pywsgi
 from geventwebsocket.handler import WebSocketHandler
 from health_bot import HealthBot
 from slack_bot_controller import SlackBotController
+from turn_tracer import JsonLinesSpanExporter, TurnTracer
 from web_socket_bot_controller import WebSocketBotController
+import gevent
 import os
+import signal
 
 class CustomFlask(Flask):
     jinja_options = Flask.jinja_options.copy()
@@ -69,19 +72,32 @@ if __name__ == '__main__':
             os.environ.get('FOURSQUARE_CLIENT_SECRET')
         )
         healthBot.init()
+        # Turns above the slow threshold are always written to the trace file in full
+        tracer = TurnTracer(
+            JsonLinesSpanExporter(os.environ.get('TRACE_FILE') or 'traces.jsonl'),
+            float(os.environ.get('TRACE_SAMPLE_RATE') or 0.0),
+            float(os.environ.get('TRACE_SLOW_TURN_MS') or 2000),
+            os.environ.get('TRACE_USER_HASH_KEY')
+        )
+        tracer.start()
         # Start Slackbot Controller
         slackBotController = SlackBotController(
             healthBot,
-            os.environ.get('SLACK_BOT_TOKEN')
+            os.environ.get('SLACK_BOT_TOKEN'),
+            tracer
         )
         slackBotController.start()
         # State WebSocket Controller
-        web_socket_bot_controller = WebSocketBotController(healthBot)
+        web_socket_bot_controller = WebSocketBotController(healthBot, tracer)
         web_socket_bot_controller.start()
         # Start HTTP/WebSocket server
         server = pywsgi.WSGIServer(('', port), app, handler_class=WebSocketHandler)
+        # Cloud Foundry stops the app with SIGTERM, so stop the server and fall through to the cleanup below
+        gevent.signal_handler(signal.SIGTERM, server.stop)
         server.serve_forever()
     except (KeyboardInterrupt, SystemExit):
-        # Stop Controllers
-        slackBotController.stop()
-        web_socket_bot_controller.stop()
\ No newline at end of file
+        pass
+    # Stop Controllers
+    slackBotController.stop()
+    web_socket_bot_controller.stop()
+    tracer.stop()
\ No newline at end of file
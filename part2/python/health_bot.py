@@ -4,6 +4,7 @@ import time
 import threading
 
 from foursquare import Foursquare
+from turn_tracer import NULL_TURN, payload_size
 from watson_developer_cloud import ConversationV1
 
 class HealthBot():
@@ -41,28 +42,32 @@ class HealthBot():
         self.user_store.init()
         self.dialog_store.init()
 
-    def process_message(self, message_sender, message):
+    def process_message(self, message_sender, message, turn=NULL_TURN):
         """
         Process the message entered by the user.
         Parameters
         ----------
         message_sender - The User ID from the messaging platform (Slack ID, or unique ID associated with the WebSocket client) 
         message - The message entered by the user
+        turn - The Turn (from TurnTracer.start_turn) used to time each downstream call, defaults to NULL_TURN (no tracing)
         """
+        turn.set_attribute('message.bytes', payload_size(message))
         conversation_response = None
         try:
-            user = self.get_or_create_user(message_sender)
-            conversation_response = self.send_request_to_watson_conversation(message, user['conversation_context'])
-            reply = self.handle_response_from_watson_conversation(message, user, conversation_response)
-            self.update_user_with_watson_conversation_context(user, conversation_response['context'])
+            user = self.get_or_create_user(message_sender, turn)
+            conversation_response = self.send_request_to_watson_conversation(message, user['conversation_context'], turn)
+            reply = self.handle_response_from_watson_conversation(message, user, conversation_response, turn)
+            self.update_user_with_watson_conversation_context(user, conversation_response['context'], turn)
+            turn.set_attribute('reply.bytes', payload_size(reply))
             return {'conversation_response': conversation_response, 'text': reply}
         except Exception:
             print(sys.exc_info())
+            turn.record_exception(*sys.exc_info()[0:2])
             # clear state and set response
             reply = "Sorry, something went wrong!"
             return {'conversation_response': conversation_response, 'text': reply}
 
-    def send_request_to_watson_conversation(self, message, conversation_context):
+    def send_request_to_watson_conversation(self, message, conversation_context, turn):
         """
         Sends the message entered by the user to Watson Conversation
         along with the active Watson Conversation context that is used to keep track of the conversation.
@@ -70,14 +75,19 @@ class HealthBot():
         ----------
         message - The message entered by the user
         conversation_context - The active Watson Conversation context
+        turn - The Turn used to time the request
         """
-        return self.conversation_client.message(
-            workspace_id=self.conversation_workspace_id,
-            message_input={'text': message},
-            context=conversation_context
-        )
+        watson_request = {'input': {'text': message}, 'context': conversation_context}
+        with turn.span('watson.message', {'request.bytes': payload_size(watson_request)}) as span:
+            conversation_response = self.conversation_client.message(
+                workspace_id=self.conversation_workspace_id,
+                message_input={'text': message},
+                context=conversation_context
+            )
+        span.set_attribute('response.bytes', payload_size(conversation_response))
+        return conversation_response
 
-    def handle_response_from_watson_conversation(self, message, user, conversation_response):
+    def handle_response_from_watson_conversation(self, message, user, conversation_response, turn):
         """ 
         Takes the response from Watson Conversation, performs any additional steps
         that may be required, and returns the reply that should be sent to the user.
@@ -86,13 +96,14 @@ class HealthBot():
         message - The message sent by the user
         user - The active user stored in Cloudant
         conversation_response - The response from Watson Conversation
+        turn - The Turn used to time any downstream calls
         """
         # get_or_create_active_conversation_id will retrieve the active conversation
         # for the current user from our Cloudant log database.
         # A new conversation doc is created anytime a new conversation is started.
         # The conversationDocId is store in the Watson Conversation context,
         # so we can access it every time a new message is received from a user.
-        conversation_doc_id = self.get_or_create_active_conversation_id(user, conversation_response)
+        conversation_doc_id = self.get_or_create_active_conversation_id(user, conversation_response, turn)
             
         # Every dialog in our workspace has been configured with a custom "action" that is available in the Watson Conversation context.
         # In some cases we need to take special steps and return a customized response for an action.
@@ -104,17 +115,18 @@ class HealthBot():
             # Variables in the context stay in there until we clear them or overwrite them, and we don't want
             # to process the wrong action if we forget to overwrite it, so here we clear the action in the context
             conversation_response['context']['action'] = None
+        turn.set_attribute('action', action)
         
         # Process the action
         if action == "findDoctorByLocation":
-            reply = self.handle_find_doctor_by_location_message(conversation_response)
+            reply = self.handle_find_doctor_by_location_message(conversation_response, turn)
         else:
             reply = self.handle_default_message(conversation_response)
 
         # Finally, we log every action performed as part of the active conversation
         # in our Cloudant dialog database and return the reply to be sent to the user.
         if conversation_doc_id is not None and action is not None:
-            self.log_dialog(conversation_doc_id, action, message, reply)
+            self.log_dialog(conversation_doc_id, action, message, reply, turn)
         
         # return reply to be sent to the user
         return reply
@@ -132,7 +144,7 @@ class HealthBot():
             reply += text + "\n"
         return reply
 
-    def handle_find_doctor_by_location_message(self, conversation_response):
+    def handle_find_doctor_by_location_message(self, conversation_response, turn):
         """
         The handler for the findDoctorByLocation action defined in the Watson Conversation dialog.
         Queries Foursquare for doctors based on the speciality identified by Watson Conversation
@@ -140,6 +152,7 @@ class HealthBot():
         Parameters
         ----------
         conversation_response - The response from Watson Conversation
+        turn - The Turn used to time the Foursquare query
         """
         if self.foursquare_client is None:
             return 'Please configure Foursquare.'
@@ -161,7 +174,9 @@ class HealthBot():
             'near': location,
             'radius': 5000
         }
-        venues = self.foursquare_client.venues.search(params=params)
+        with turn.span('foursquare.venues.search', {'request.bytes': payload_size(params)}) as span:
+            venues = self.foursquare_client.venues.search(params=params)
+        span.set_attribute('response.bytes', payload_size(venues))
         if venues is None or 'venues' not in venues.keys() or len(venues['venues']) == 0:
             reply = 'Sorry, I couldn\'t find any doctors near you.'
         else:
@@ -172,27 +187,33 @@ class HealthBot():
                 reply = reply + '* ' + venue['name']
         return reply
 
-    def get_or_create_user(self, message_sender):
+    def get_or_create_user(self, message_sender, turn):
         """
         Retrieves the user doc stored in the Cloudant database associated with the current user interacting with the bot.
         First checks if the user is stored in Cloudant. If not, a new user is created in Cloudant.
         Parameters
         ----------
         message_sender - The User ID from the messaging platform (Slack ID, or unique ID associated with the WebSocket client) 
+        turn - The Turn used to time the Cloudant request
         """
-        return self.user_store.add_user(message_sender)
+        with turn.span('cloudant.add_user') as span:
+            user = self.user_store.add_user(message_sender)
+        span.set_attribute('response.bytes', payload_size(user))
+        return user
 
-    def update_user_with_watson_conversation_context(self, user, conversation_context):
+    def update_user_with_watson_conversation_context(self, user, conversation_context, turn):
         """
         Updates the user doc in Cloudant with the latest Watson Conversation context.
         Parameters
         ----------
         user - The user doc associated with the active user
         conversation_context - The Watson Conversation context
+        turn - The Turn used to time the Cloudant request
         """
-        return self.user_store.update_user(user, conversation_context)
+        with turn.span('cloudant.update_user', {'request.bytes': payload_size(conversation_context)}):
+            return self.user_store.update_user(user, conversation_context)
 
-    def get_or_create_active_conversation_id(self, user, conversation_response):
+    def get_or_create_active_conversation_id(self, user, conversation_response, turn):
         """
         Retrieves the ID of the active conversation doc in the Cloudant conversation log database for the current user.
         If this is the start of a new converation then a new document is created in Cloudant,
@@ -201,6 +222,7 @@ class HealthBot():
         ----------
         user - The user doc associated with the active user
         conversation_response - The response from Watson Conversation
+        turn - The Turn used to time the Cloudant request
         """
         if 'newConversation' in conversation_response['context'].keys():
             new_conversation = conversation_response['context']['newConversation']
@@ -208,7 +230,8 @@ class HealthBot():
             new_conversation = False
         if new_conversation == True:
             conversation_response['context']['newConversation'] = False
-            converation_doc = self.dialog_store.add_conversation(user['_id'])
+            with turn.span('cloudant.add_conversation'):
+                converation_doc = self.dialog_store.add_conversation(user['_id'])
             conversation_response['context']['conversationDocId'] = converation_doc['_id']
             return converation_doc['_id']
         elif 'conversationDocId' in conversation_response['context'].keys():
@@ -216,7 +239,7 @@ class HealthBot():
         else:
             return None
 
-    def log_dialog(self, conversation_doc_id, name, message, reply):
+    def log_dialog(self, conversation_doc_id, name, message, reply, turn):
         """
         Logs the dialog traversed in Watson Conversation by the current user to the Cloudant log database.
         Parameters
@@ -225,6 +248,7 @@ class HealthBot():
         name - The name of the dialog (action)
         message - The message sent by the user
         reply - The reply sent to the user
+        turn - The Turn used to time the Cloudant request
         """
         dialog_doc = {
             'name': name,
@@ -232,4 +256,5 @@ class HealthBot():
             'reply': reply,
             'date': int(time.time()*1000)
         }
-        self.dialog_store.add_dialog(conversation_doc_id, dialog_doc)
+        with turn.span('cloudant.add_dialog', {'request.bytes': payload_size(dialog_doc)}):
+            self.dialog_store.add_dialog(conversation_doc_id, dialog_doc)
@@ -1,13 +1,15 @@
 import threading
 import time
 from slackclient import SlackClient
+from turn_tracer import payload_size
 
 class SlackBotController(threading.Thread):
 
 
-	def __init__(self, health_bot, slack_token):
+	def __init__(self, health_bot, slack_token, tracer):
 		threading.Thread.__init__(self)
 		self.health_bot = health_bot
+		self.tracer = tracer
 		self.slack_client = SlackClient(slack_token)
 		self.running = False
 
@@ -19,8 +21,10 @@ class SlackBotController(threading.Thread):
 				slack_output = self.slack_client.rtm_read()
 				message, message_sender, channel = self.parse_slack_output(slack_output)
 				if message and channel and channel[0] == 'D':
-					reply = self.health_bot.process_message(message_sender, message)
-					self.post_to_slack(reply['text'], channel)
+					with self.tracer.start_turn('slack', message_sender) as turn:
+						reply = self.health_bot.process_message(message_sender, message, turn)
+						with turn.span('slack.post_message', {'request.bytes': payload_size(reply['text'])}):
+							self.post_to_slack(reply['text'], channel)
 				time.sleep(0.1)
 		else:
 			print("Connection failed. Invalid Slack token?")
@@ -0,0 +1,409 @@
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import random
+import threading
+import time
+import timeit
+import traceback
+
+
+# Text is unicode on Python 2 and str on Python 3
+try:
+    _text_type = unicode
+except NameError:
+    _text_type = str
+
+
+def payload_size(payload):
+    """
+    Returns the size of the payload in UTF-8 encoded bytes, or None if it can't be serialized.
+    Strings are measured as-is; anything else is measured as its JSON serialization
+    without escaping non-ASCII characters, so every size is on the same basis.
+    Parameters
+    ----------
+    payload - The payload (string, dict, list, etc.) to measure
+    """
+    if payload is None:
+        return 0
+    try:
+        if not isinstance(payload, (bytes, _text_type)):
+            payload = json.dumps(payload, ensure_ascii=False)
+        if isinstance(payload, _text_type):
+            payload = payload.encode('utf-8')
+        return len(payload)
+    except (TypeError, ValueError, UnicodeError):
+        return None
+
+
+def hash_user(user_id, key):
+    """
+    Returns a short HMAC-SHA256 of the user ID so traces can be correlated per user
+    without writing the Slack ID or WebSocket client ID to disk.
+    The hash can't be reversed by guessing IDs without the key.
+    Parameters
+    ----------
+    user_id - The User ID from the messaging platform
+    key - The secret key (bytes) used to hash the user ID
+    """
+    if user_id is None:
+        return None
+    return hmac.new(key, u'{}'.format(user_id).encode('utf-8'), hashlib.sha256).hexdigest()[0:16]
+
+
+def _new_id(num_bytes):
+    return binascii.hexlify(os.urandom(num_bytes)).decode('ascii')
+
+
+def _now_nanos():
+    return int(time.time() * 1e9)
+
+
+# time.monotonic is not available on Python 2
+_clock = getattr(time, 'monotonic', timeit.default_timer)
+
+
+class Span(object):
+
+    def __init__(self, trace_id, parent_span_id, name, attributes):
+        """
+        Creates a new instance of Span, a single timed operation within a turn.
+        Parameters
+        ----------
+        trace_id - The ID of the turn this span belongs to
+        parent_span_id - The ID of the enclosing span, or None for the root span
+        name - The name of the operation (i.e. watson.message, cloudant.add_user)
+        attributes - Dictionary of attributes to annotate the span with
+        """
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.attributes = dict(attributes)
+        self.status = 'OK'
+        # Wall clock time is only reported; durations use the monotonic clock so clock adjustments can't skew them
+        self.start_time = _now_nanos()
+        self.end_time = None
+        self.start_clock = _clock()
+        self.end_clock = None
+
+    def set_attribute(self, key, value):
+        """
+        Adds or replaces an attribute on the span.
+        Parameters
+        ----------
+        key - The name of the attribute
+        value - The value of the attribute (must be JSON serializable)
+        """
+        self.attributes[key] = value
+
+    def record_exception(self, exc_type, exc_value):
+        """
+        Marks the span as failed and records the exception.
+        Parameters
+        ----------
+        exc_type - The type of the exception raised
+        exc_value - The exception raised
+        """
+        self.status = 'ERROR'
+        self.attributes['error.type'] = exc_type.__name__
+        self.attributes['error.message'] = ''.join(traceback.format_exception_only(exc_type, exc_value)).strip()
+
+    def end(self):
+        if self.end_time is None:
+            self.end_time = _now_nanos()
+            self.end_clock = _clock()
+
+    def duration_ms(self):
+        end_clock = self.end_clock if self.end_clock is not None else _clock()
+        return (end_clock - self.start_clock) * 1000
+
+    def to_dict(self):
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_span_id,
+            'name': self.name,
+            'startTimeUnixNano': self.start_time,
+            'endTimeUnixNano': self.end_time,
+            'durationMs': round(self.duration_ms(), 3),
+            'status': self.status,
+            'attributes': self.attributes
+        }
+
+
+class _SpanScope(object):
+
+    def __init__(self, turn, span):
+        self.turn = turn
+        self.span = span
+
+    def __enter__(self):
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.span.record_exception(exc_type, exc_value)
+        self.turn._end_span(self.span)
+        return False
+
+
+class Turn(object):
+
+    def __init__(self, tracer, source, message_sender, sampled):
+        """
+        Creates a new instance of Turn, the trace of a single message from a user through to the reply.
+        Use TurnTracer.start_turn rather than creating a Turn directly.
+        Parameters
+        ----------
+        tracer - The TurnTracer that will export the turn when it ends
+        source - Where the message came from (slack or websocket)
+        message_sender - The User ID from the messaging platform
+        sampled - True if the turn should be exported regardless of its latency
+        """
+        self.tracer = tracer
+        self.trace_id = _new_id(16)
+        self.source = source
+        self.sampled = sampled
+        self.spans = []
+        self.active_spans = []
+        self.root_span = self._start_span('turn', {
+            'source': source,
+            'user.hash': hash_user(message_sender, tracer.user_hash_key)
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.record_exception(exc_type, exc_value)
+        self.end()
+        return False
+
+    def span(self, name, attributes=None):
+        """
+        Returns a context manager that times the enclosed block as a child span of the active span.
+        Parameters
+        ----------
+        name - The name of the operation (i.e. watson.message, cloudant.add_user)
+        attributes - Dictionary of attributes to annotate the span with
+        """
+        return _SpanScope(self, self._start_span(name, attributes or {}))
+
+    def set_attribute(self, key, value):
+        """
+        Adds or replaces an attribute on the root span of the turn.
+        Parameters
+        ----------
+        key - The name of the attribute
+        value - The value of the attribute (must be JSON serializable)
+        """
+        self.root_span.set_attribute(key, value)
+
+    def record_exception(self, exc_type, exc_value):
+        """
+        Marks the turn as failed and records the exception on the root span.
+        Parameters
+        ----------
+        exc_type - The type of the exception raised
+        exc_value - The exception raised
+        """
+        self.root_span.record_exception(exc_type, exc_value)
+
+    def end(self):
+        """
+        Ends the turn and hands it to the tracer to be exported.
+        """
+        if self.root_span.end_time is not None:
+            return
+        self.root_span.end()
+        self.tracer.finish_turn(self)
+
+    def duration_ms(self):
+        return self.root_span.duration_ms()
+
+    def to_dict(self, slow):
+        return {
+            'traceId': self.trace_id,
+            'source': self.source,
+            'durationMs': round(self.duration_ms(), 3),
+            'slow': slow,
+            'sampled': self.sampled,
+            'spans': [span.to_dict() for span in self.spans]
+        }
+
+    def _start_span(self, name, attributes):
+        parent_span_id = self.active_spans[-1].span_id if len(self.active_spans) > 0 else None
+        span = Span(self.trace_id, parent_span_id, name, attributes)
+        self.spans.append(span)
+        self.active_spans.append(span)
+        return span
+
+    def _end_span(self, span):
+        span.end()
+        if span in self.active_spans:
+            self.active_spans.remove(span)
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+class NullTurn(object):
+    """
+    A Turn that records nothing. Used by HealthBot when a message is processed without a trace.
+    Use the shared NULL_TURN instance rather than creating a NullTurn directly.
+    """
+
+    def span(self, name, attributes=None):
+        return _NULL_SPAN
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, exc_type, exc_value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+NULL_TURN = NullTurn()
+
+
+class JsonLinesSpanExporter(object):
+
+    def __init__(self, file_path, max_buffer_size=20, flush_interval_secs=10):
+        """
+        Creates a new instance of JsonLinesSpanExporter.
+        Turns are buffered in memory and appended to the file as one JSON document per line.
+        Parameters
+        ----------
+        file_path - The path of the JSONL file to append turns to
+        max_buffer_size - The number of turns to buffer before writing to the file
+        flush_interval_secs - How often, in seconds, buffered turns are written to the file once the exporter is started
+        """
+        self.file_path = file_path
+        self.max_buffer_size = max_buffer_size
+        self.flush_interval_secs = flush_interval_secs
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts a background thread that writes buffered turns to the file every flush_interval_secs.
+        """
+        self.stopped.clear()
+        flush_thread = threading.Thread(target=self._flush_periodically)
+        flush_thread.daemon = True
+        flush_thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread and writes any buffered turns to the file.
+        """
+        self.stopped.set()
+        self.flush()
+
+    def export(self, turn_doc, flush=False):
+        """
+        Adds a turn to the buffer, writing the buffer to the file if it is full.
+        Parameters
+        ----------
+        turn_doc - The turn (as returned from Turn.to_dict) to export
+        flush - True to write the buffer to the file immediately
+        """
+        with self.lock:
+            self.buffer.append(turn_doc)
+            if flush or len(self.buffer) >= self.max_buffer_size:
+                self._flush()
+
+    def flush(self):
+        """
+        Writes any buffered turns to the file.
+        """
+        with self.lock:
+            self._flush()
+
+    def _flush_periodically(self):
+        while not self.stopped.wait(self.flush_interval_secs):
+            self.flush()
+
+    def _flush(self):
+        if len(self.buffer) == 0:
+            return
+        lines = [json.dumps(turn_doc, default=str) for turn_doc in self.buffer]
+        self.buffer = []
+        try:
+            with open(self.file_path, 'a') as trace_file:
+                trace_file.write('\n'.join(lines) + '\n')
+        except (IOError, OSError):
+            print('Unable to write traces to {}: {}'.format(self.file_path, traceback.format_exc()))
+
+
+class TurnTracer(object):
+
+    def __init__(self, exporter, sample_rate=0.0, slow_turn_threshold_ms=2000, user_hash_key=None):
+        """
+        Creates a new instance of TurnTracer.
+        Every turn is timed, but only sampled turns and turns slower than the threshold are exported.
+        Parameters
+        ----------
+        exporter - Instance of JsonLinesSpanExporter (or any object with start, stop and export methods)
+        sample_rate - The fraction of turns (0.0 - 1.0) to export regardless of latency
+        slow_turn_threshold_ms - Turns taking at least this many milliseconds are always exported in full
+        user_hash_key - The secret key used to hash user IDs. If not set a random key is generated,
+                        so user hashes will not match across restarts.
+        """
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_turn_threshold_ms = slow_turn_threshold_ms
+        if user_hash_key:
+            self.user_hash_key = user_hash_key.encode('utf-8')
+        else:
+            self.user_hash_key = os.urandom(32)
+
+    def start_turn(self, source, message_sender):
+        """
+        Starts a new turn and assigns it a trace ID.
+        Parameters
+        ----------
+        source - Where the message came from (slack or websocket)
+        message_sender - The User ID from the messaging platform
+        """
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        return Turn(self, source, message_sender, sampled)
+
+    def finish_turn(self, turn):
+        """
+        Exports the turn if it was sampled or exceeded the slow turn threshold.
+        Slow turns are written to the exporter immediately.
+        Parameters
+        ----------
+        turn - The Turn that has ended
+        """
+        slow = self.slow_turn_threshold_ms is not None and turn.duration_ms() >= self.slow_turn_threshold_ms
+        if slow or turn.sampled:
+            self.exporter.export(turn.to_dict(slow), flush=slow)
+
+    def start(self):
+        """
+        Starts the exporter so buffered turns are written periodically.
+        """
+        self.exporter.start()
+
+    def stop(self):
+        """
+        Stops the exporter, writing any buffered turns.
+        """
+        self.exporter.stop()
@@ -1,12 +1,14 @@
 import json
 import time
 from slackclient import SlackClient
+from turn_tracer import payload_size
 
 class WebSocketBotController():
 
 
-	def __init__(self, health_bot):
+	def __init__(self, health_bot, tracer):
 		self.health_bot = health_bot
+		self.tracer = tracer
 		
 	def start(self):
 		self.running = True
@@ -24,10 +26,12 @@ class WebSocketBotController():
 		else:
 			message_sender = msg['userId']
 			message = msg['text']
-			reply = self.health_bot.process_message(message_sender, message)
-			replyMsg = {
-				'type': 'msg',
-				'text': reply['text'],
-				'watsonData': reply['conversation_response']
-			}
-			ws.send(json.dumps(replyMsg))
\ No newline at end of file
+			with self.tracer.start_turn('websocket', message_sender) as turn:
+				reply = self.health_bot.process_message(message_sender, message, turn)
+				replyMsg = {
+					'type': 'msg',
+					'text': reply['text'],
+					'watsonData': reply['conversation_response']
+				}
+				with turn.span('websocket.send', {'request.bytes': payload_size(replyMsg)}):
+					ws.send(json.dumps(replyMsg))
\ No newline at end of file